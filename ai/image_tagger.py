@@ -0,0 +1,106 @@
+"""
+Image Tagger - CLIP-based auto tagging and image embeddings
+"""
+import os
+import numpy as np
+import torch
+from PIL import Image
+from transformers import CLIPModel, CLIPProcessor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Candidate labels: (tag stored in DB, English prompt for CLIP)
+CANDIDATE_LABELS = [
+    ("โรงพยาบาล", "a photo of a hospital building"),
+    ("คลินิก", "a photo of a medical clinic"),
+    ("โรงเรียน", "a photo of a school building"),
+    ("วัด", "a photo of a buddhist temple"),
+    ("ตลาด", "a photo of a market"),
+    ("ศูนย์พักพิง", "a photo of an evacuation shelter"),
+    ("อาหาร", "a photo of food supplies"),
+    ("น้ำดื่ม", "a photo of drinking water bottles"),
+    ("ยารักษาโรค", "a photo of medicine and medical supplies"),
+    ("รถพยาบาล", "a photo of an ambulance"),
+    ("น้ำท่วม", "a photo of a flooded area"),
+    ("อาคาร", "a photo of a building"),
+    ("ถนน", "a photo of a road"),
+    ("ผู้คน", "a photo of a crowd of people"),
+    ("สนามกีฬา", "a photo of a sports stadium"),
+]
+
+
+class ImageTagger:
+    """สร้าง tags และ embedding จากรูปภาพด้วย CLIP"""
+
+    def __init__(self, model_name: str = None, device: str = None):
+        self.model_name = model_name or os.getenv('IMAGE_MODEL', 'openai/clip-vit-base-patch32')
+        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+
+        self.model = CLIPModel.from_pretrained(self.model_name).to(self.device).eval()
+        self.processor = CLIPProcessor.from_pretrained(self.model_name)
+
+        # Embed all label prompts once at startup in a single batch so
+        # tagging an image is just one matmul against this matrix
+        self.labels = [tag for tag, _ in CANDIDATE_LABELS]
+        prompts = [prompt for _, prompt in CANDIDATE_LABELS]
+        with torch.no_grad():
+            tokens = self.processor(text=prompts, return_tensors='pt', padding=True).to(self.device)
+            label_emb = self.model.get_text_features(**tokens)
+        label_emb = label_emb / label_emb.norm(dim=-1, keepdim=True)
+        # Pre-normalized contiguous (n_labels, dim) float32 matrix so
+        # scoring is a single BLAS matvec, not per-label Python work
+        self.label_emb = np.ascontiguousarray(label_emb.cpu().numpy(), dtype=np.float32)
+
+    def _encode_image(self, path: str) -> torch.Tensor:
+        """Load + preprocess + run the vision encoder once"""
+        image = Image.open(path).convert('RGB')
+        pixels = self.processor(images=image, return_tensors='pt').to(self.device)
+        with torch.no_grad():
+            emb = self.model.get_image_features(**pixels)
+        return emb / emb.norm(dim=-1, keepdim=True)
+
+    def _tags_from_embedding(self, emb: np.ndarray, top_k: int = 5,
+                             threshold: float = 0.2) -> list:
+        """เลือก tags จาก embedding ที่คำนวณไว้แล้ว"""
+        sims = self.label_emb @ emb
+        k = min(top_k, sims.shape[0])
+        # argpartition: O(L) top-k selection, then sort only the k hits
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [self.labels[i] for i in top if sims[i] >= threshold]
+
+    def tag_and_embed(self, path: str, top_k: int = 5) -> tuple:
+        """
+        สร้าง embedding และ tags ในการ forward ครั้งเดียว
+
+        The vision encoder dominates per-image cost, so deriving the
+        tags from the embedding instead of re-encoding is ~2x faster
+        than calling get_image_embedding + generate_tags separately.
+        """
+        emb = self._encode_image(path).cpu().numpy()[0]
+        tags = self._tags_from_embedding(emb, top_k)
+        return emb, tags
+
+    def generate_tags(self, path: str, top_k: int = 5) -> list:
+        """สร้าง tags อัตโนมัติจากรูปภาพ"""
+        emb = self._encode_image(path).cpu().numpy()[0]
+        return self._tags_from_embedding(emb, top_k)
+
+    def get_image_embedding(self, path: str):
+        """สร้าง embedding จากรูปภาพ (normalized)"""
+        return self._encode_image(path).cpu().numpy()[0]
+
+    def encode_images(self, paths: list) -> np.ndarray:
+        """
+        สร้าง embeddings หลายรูปในการ forward ครั้งเดียว
+
+        Returns an (n_images, dim) array of normalized embeddings;
+        one batched pass is much cheaper than n separate encodes.
+        """
+        images = [Image.open(p).convert('RGB') for p in paths]
+        pixels = self.processor(images=images, return_tensors='pt').to(self.device)
+        with torch.no_grad():
+            emb = self.model.get_image_features(**pixels)
+        emb = emb / emb.norm(dim=-1, keepdim=True)
+        return emb.cpu().numpy()
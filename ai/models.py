@@ -0,0 +1,80 @@
+"""
+Central model registry - one instance of each model per process
+
+api/images.py and data_loader.py each loaded their own models at
+import time, which doubles memory when both are imported and repeats
+the cold-start per uvicorn reload. The lru_cache getters below make
+every caller share one instance; main.py warms them in the FastAPI
+lifespan so the first request doesn't pay model-load latency.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# Embedding model: prefer an ONNX Runtime export when one has been
+# produced by scripts/export_minilm_onnx.py (2-4x faster on CPU),
+# otherwise fall back to the regular PyTorch SentenceTransformer
+TEXT_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', 'models/minilm-onnx')
+
+
+class OnnxTextEncoder:
+    """SentenceTransformer-compatible .encode() backed by ONNX Runtime"""
+
+    def __init__(self, model_dir: str):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        # Prefer the int8-quantized graph when the export produced one
+        model_file = os.path.join(model_dir, 'model_quantized.onnx')
+        if not os.path.isfile(model_file):
+            model_file = os.path.join(model_dir, 'model.onnx')
+        self.session = ort.InferenceSession(model_file, providers=['CPUExecutionProvider'])
+        self._input_names = {inp.name for inp in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        batches = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(texts[i:i + batch_size], padding=True,
+                                 truncation=True, return_tensors='np')
+            feed = {k: v for k, v in enc.items() if k in self._input_names}
+            hidden = self.session.run(None, feed)[0]
+
+            # Mean pooling + L2 normalize, same as the ST pipeline
+            mask = enc['attention_mask'][..., None].astype(hidden.dtype)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+            batches.append(emb.astype(np.float32))
+
+        embeddings = np.concatenate(batches)
+        return embeddings[0] if single else embeddings
+
+
+@lru_cache
+def get_image_tagger():
+    """CLIP tagger/embedder singleton"""
+    from ai.image_tagger import ImageTagger
+    return ImageTagger()
+
+
+@lru_cache
+def get_text_encoder():
+    """Text embedding model singleton (ONNX export if available)"""
+    if os.path.isdir(ONNX_MODEL_PATH):
+        try:
+            encoder = OnnxTextEncoder(ONNX_MODEL_PATH)
+            print(f"⚡ Using ONNX Runtime text encoder from {ONNX_MODEL_PATH}")
+            return encoder
+        except Exception as e:
+            print(f"⚠️ ONNX encoder unavailable ({e}), falling back to PyTorch")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(TEXT_MODEL_NAME)
@@ -2,38 +2,264 @@
 Image Management API
 """
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from typing import Optional, List
+import contextlib
+from contextlib import contextmanager
 import os
 import json
 import uuid
+import hashlib
+import numpy as np
+import aiofiles
+import aiofiles.os
+import diskcache
 from datetime import datetime
-import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2.extras import RealDictCursor
 from pgvector.psycopg2 import register_vector
+from cachetools import TTLCache
 import sys
 sys.path.append('..')
 
-from ai.image_tagger import ImageTagger
+from ai.models import get_image_tagger
 from dotenv import load_dotenv
 
 load_dotenv()
 
 router = APIRouter(prefix="/api/images", tags=["images"])
 
-# Initialize
-image_tagger = ImageTagger()
+# Initialize - the CLIP model comes from the shared registry and is
+# loaded lazily (main.py warms it in the lifespan hook)
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 DB_URL = os.getenv('DATABASE_URL')
 
+# Stream uploads to disk in fixed chunks so a large file never sits
+# fully in RAM and the event loop is not blocked by sync writes
+CHUNK_SIZE = 1 << 20  # 1 MB
 
-def get_db_connection():
-    """Get database connection"""
-    conn = psycopg2.connect(DB_URL)
-    register_vector(conn)
-    return conn
+# Content-addressed cache: duplicate images skip the CLIP forward pass
+# entirely and become a disk lookup keyed by SHA-256 of the bytes
+emb_cache = diskcache.Cache('.emb_cache')
+
+# TTL cache for hot read-only endpoints (/api/stats); dashboard numbers
+# change on the order of minutes, not per request. Uploads and deletes
+# invalidate the entry so stale data never outlives a write.
+stats_cache = TTLCache(maxsize=16, ttl=60)
+
+
+async def save_upload(file: UploadFile, file_path: str) -> tuple:
+    """Stream an upload to disk chunk-by-chunk.
+
+    Returns (total bytes, SHA-256 hex digest of the content).
+    """
+    total = 0
+    sha256 = hashlib.sha256()
+    async with aiofiles.open(file_path, 'wb') as f:
+        while chunk := await file.read(CHUNK_SIZE):
+            await f.write(chunk)
+            sha256.update(chunk)
+            total += len(chunk)
+    return total, sha256.hexdigest()
+
+
+# Small sync helpers so endpoints can push blocking psycopg2 work off
+# the event loop with run_in_threadpool - an async handler that calls
+# cur.execute directly stalls every other in-flight request
+def db_fetchone(query: str, params=None):
+    """Run a query on a pooled connection and return one row"""
+    with db_cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchone()
+
+
+def db_fetchall(query: str, params=None):
+    """Run a query on a pooled connection and return all rows"""
+    with db_cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def db_execute(query: str, params=None):
+    """Run a statement on a pooled connection (no result)"""
+    with db_cursor() as cur:
+        cur.execute(query, params)
+
+
+def image_similarity_search(query_embedding, limit: int):
+    """ANN search with per-transaction ef_search tuning"""
+    with db_cursor() as cur:
+        cur.execute("SET LOCAL hnsw.ef_search = 40")
+        cur.execute("EXECUTE image_search (%s, %s)", (query_embedding, limit))
+        return cur.fetchall()
+
+
+def store_uploaded_image(asset_id: int, image_data: dict, tags, image_embedding):
+    """Insert the image row and update asset tags/embedding in one txn"""
+    with db_cursor() as cur:
+        cur.execute("EXECUTE insert_image (%s, %s)",
+                    (asset_id, json.dumps(image_data)))
+        image_id = cur.fetchone()['id']
+
+        cur.execute("EXECUTE upload_meta (%s, %s, %s)",
+                    (tags, image_embedding, asset_id))
+
+        cur.execute("EXECUTE count_images (%s)", (asset_id,))
+        total = cur.fetchone()['total']
+    return image_id, total
+
+
+def batch_image_similarity_search(embeddings, limit: int):
+    """ANN search for several query vectors in one statement.
+
+    unnest + LATERAL runs one index probe per query vector inside a
+    single round-trip, so N-image searches share parse, network and
+    warm-cache costs instead of doing N separate requests.
+    """
+    vecs = ['[' + ','.join(str(x) for x in emb.astype(np.float32)) + ']'
+            for emb in embeddings]
+
+    with db_cursor() as cur:
+        cur.execute("SET LOCAL hnsw.ef_search = 40")
+        cur.execute("""
+            SELECT q.idx, t.*
+            FROM unnest(%s::halfvec[]) WITH ORDINALITY AS q(vec, idx),
+            LATERAL (
+                SELECT
+                    id,
+                    name,
+                    location_type,
+                    district,
+                    province,
+                    tags,
+                    (SELECT jsonb_agg(ai.data ORDER BY ai.id)
+                     FROM asset_images ai WHERE ai.asset_id = assets.id) as images,
+                    ST_AsText(location) as coordinates,
+                    1 - (image_embeddings <=> q.vec) as similarity
+                FROM assets
+                WHERE image_embeddings IS NOT NULL
+                ORDER BY image_embeddings <=> q.vec
+                LIMIT %s
+            ) t
+        """, (vecs, limit))
+        return cur.fetchall()
+
+
+def tag_and_embed_cached(file_path: str, digest: str) -> dict:
+    """Run tagging + embedding, reusing cached results for known content"""
+    hit = emb_cache.get(digest)
+    if hit is None:
+        # Single fused forward pass instead of encoding the image
+        # once for tags and again for the embedding. Stored as fp16 to
+        # match the halfvec column and halve cache/storage bytes.
+        embedding, tags = get_image_tagger().tag_and_embed(file_path)
+        hit = {'tags': tags, 'embedding': embedding.astype(np.float16)}
+        emb_cache.set(digest, hit)
+    return hit
+
+class PoolConnection(psycopg2.extensions.connection):
+    """Connection class for the pool.
+
+    The base C connection type has no instance __dict__, so the
+    per-connection setup flag must live on a Python subclass.
+    """
+    configured = False
+
+
+# Shared connection pool - opening a fresh connection per request costs
+# a TCP+TLS handshake each time and dominates latency under load
+pool = ThreadedConnectionPool(minconn=2, maxconn=16, dsn=DB_URL,
+                              connection_factory=PoolConnection)
+
+
+# Server-side prepared statements for the hot endpoints, created once
+# per pooled connection. psycopg2 has no cursor.prepare(), so plans are
+# built with PREPARE and reused via EXECUTE for the connection's
+# lifetime, skipping parse+plan on every request.
+PREPARED_STATEMENTS = (
+    "PREPARE asset_exists (int) AS "
+    "SELECT id FROM assets WHERE id = $1",
+
+    "PREPARE asset_detail (int) AS "
+    "SELECT id, name, tags FROM assets WHERE id = $1",
+
+    "PREPARE list_images (int) AS "
+    "SELECT id, data FROM asset_images WHERE asset_id = $1 ORDER BY id",
+
+    "PREPARE get_image (bigint, int) AS "
+    "SELECT id, data FROM asset_images WHERE id = $1 AND asset_id = $2",
+
+    "PREPARE delete_image_row (bigint) AS "
+    "DELETE FROM asset_images WHERE id = $1",
+
+    "PREPARE count_images (int) AS "
+    "SELECT COUNT(*) as total FROM asset_images WHERE asset_id = $1",
+
+    "PREPARE insert_image (int, jsonb) AS "
+    "INSERT INTO asset_images (asset_id, data) VALUES ($1, $2) RETURNING id",
+
+    """PREPARE upload_meta (text[], halfvec, int) AS
+        UPDATE assets
+        SET
+            tags = COALESCE(tags, ARRAY[]::text[]) || $1,
+            image_embeddings = COALESCE($2, image_embeddings)
+        WHERE id = $3""",
+
+    """PREPARE image_search (halfvec, int) AS
+        SELECT
+            id,
+            name,
+            location_type,
+            district,
+            province,
+            tags,
+            (SELECT jsonb_agg(ai.data ORDER BY ai.id)
+             FROM asset_images ai WHERE ai.asset_id = assets.id) as images,
+            ST_AsText(location) as coordinates,
+            1 - (image_embeddings <=> $1) as similarity
+        FROM assets
+        WHERE image_embeddings IS NOT NULL
+        ORDER BY image_embeddings <=> $1
+        LIMIT $2""",
+)
+
+
+@contextmanager
+def db_cursor():
+    """Get a cursor on a pooled connection, commit on success"""
+    conn = pool.getconn()
+    try:
+        # register_vector runs a catalog query and PREPARE a parse+plan
+        # each, so do both once per pooled connection, not per request
+        if not conn.configured:
+            register_vector(conn)
+            with conn.cursor() as prep:
+                # Skip statements that already exist so a connection
+                # that prepared them but failed before the flag was set
+                # can't poison the pool with DuplicatePreparedStatement
+                prep.execute("SELECT name FROM pg_prepared_statements")
+                existing = {row[0] for row in prep.fetchall()}
+                for statement in PREPARED_STATEMENTS:
+                    if statement.split()[1] not in existing:
+                        prep.execute(statement)
+            conn.commit()
+            conn.configured = True
+
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    finally:
+        pool.putconn(conn)
 
 
 @router.post("/upload/{asset_id}")
@@ -54,12 +280,9 @@ async def upload_image(
     """
     try:
         # 1. ตรวจสอบว่า asset มีอยู่จริง
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("SELECT id FROM assets WHERE id = %s", (asset_id,))
-        asset = cur.fetchone()
-        
+        asset = await run_in_threadpool(
+            db_fetchone, "EXECUTE asset_exists (%s)", (asset_id,))
+
         if not asset:
             raise HTTPException(status_code=404, detail="Asset not found")
         
@@ -68,56 +291,42 @@ async def upload_image(
         unique_filename = f"{asset_id}_{uuid.uuid4()}{file_ext}"
         file_path = os.path.join(UPLOAD_DIR, unique_filename)
         
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
+        size, digest = await save_upload(file, file_path)
+
         # 3. สร้าง tags อัตโนมัติ (ถ้าต้องการ)
         tags = []
         image_embedding = None
-        
+
         if auto_tag:
-            tags = image_tagger.generate_tags(file_path)
-            image_embedding = image_tagger.get_image_embedding(file_path)
-        
+            hit = await run_in_threadpool(tag_and_embed_cached, file_path, digest)
+            tags = hit['tags']
+            image_embedding = hit['embedding']
+
         # 4. สร้าง image object
         image_data = {
             "url": f"/uploads/{unique_filename}",
             "filename": file.filename,
             "caption": caption,
             "uploaded_at": datetime.now().isoformat(),
-            "size": len(content),
+            "size": size,
+            "sha256": digest,
             "content_type": file.content_type
         }
         
-        # 5. อัพเดท database
-        cur.execute("""
-            UPDATE assets 
-            SET 
-                images = COALESCE(images, '[]'::jsonb) || %s::jsonb,
-                tags = COALESCE(tags, ARRAY[]::text[]) || %s::text[],
-                image_embeddings = COALESCE(%s::vector, image_embeddings)
-            WHERE id = %s
-            RETURNING id, images, tags
-        """, (
-            json.dumps([image_data]),
-            tags,
-            image_embedding,
-            asset_id
-        ))
-        
-        updated = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
+        # 5. อัพเดท database - O(1) insert into asset_images instead of
+        # rewriting the asset's whole jsonb array on every upload
+        image_id, total_images = await run_in_threadpool(
+            store_uploaded_image, asset_id, image_data, tags, image_embedding)
+
+        stats_cache.pop('stats', None)
+
         return {
             "message": "Image uploaded successfully",
             "asset_id": asset_id,
+            "image_id": image_id,
             "image": image_data,
             "generated_tags": tags,
-            "total_images": len(updated['images']) if updated else 0
+            "total_images": total_images
         }
         
     except Exception as e:
@@ -136,57 +345,85 @@ async def search_by_image(
     2. สร้าง embedding
     3. ค้นหา assets ที่มีรูปคล้ายกัน
     """
+    temp_path = os.path.join(UPLOAD_DIR, f"temp_{uuid.uuid4()}.jpg")
     try:
         # 1. บันทึกไฟล์ชั่วคราว
-        temp_path = os.path.join(UPLOAD_DIR, f"temp_{uuid.uuid4()}.jpg")
-        
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # 2. สร้าง embedding
-        query_embedding = image_tagger.get_image_embedding(temp_path)
-        
-        # 3. สร้าง tags จากรูป
-        query_tags = image_tagger.generate_tags(temp_path)
+        _, digest = await save_upload(file, temp_path)
+
+        # 2-3. สร้าง embedding และ tags (cache ตาม content hash)
+        hit = await run_in_threadpool(tag_and_embed_cached, temp_path, digest)
+        query_embedding = hit['embedding']
+        query_tags = hit['tags']
         
         # 4. ค้นหาด้วย vector similarity
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("""
-            SELECT 
-                id,
-                name,
-                location_type,
-                district,
-                province,
-                tags,
-                images,
-                ST_AsText(location) as coordinates,
-                1 - (image_embeddings <=> %s::vector) as similarity
-            FROM assets
-            WHERE image_embeddings IS NOT NULL
-            ORDER BY similarity DESC
-            LIMIT %s
-        """, (query_embedding, limit))
-        
-        results = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        
-        # 5. ลบไฟล์ชั่วคราว
-        os.remove(temp_path)
-        
+        # ORDER BY must use the raw distance operator - ordering by the
+        # computed "similarity DESC" alias forces a sequential scan and
+        # the HNSW/IVFFlat index is never used
+        results = await run_in_threadpool(
+            image_similarity_search, query_embedding, limit)
+
         return {
             "results": [dict(row) for row in results],
             "detected_tags": query_tags,
             "total": len(results)
         }
-        
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # ลบไฟล์ชั่วคราว - also on error paths, so failures can't
+        # leak temp files into uploads/
+        with contextlib.suppress(FileNotFoundError):
+            await aiofiles.os.remove(temp_path)
+
+
+@router.post("/search-by-image-batch")
+async def search_by_image_batch(
+    files: List[UploadFile] = File(...),
+    limit: int = 10
+):
+    """
+    ค้นหา assets ด้วยหลายรูปพร้อมกัน
+
+    Embeds all images in one CLIP forward pass and probes the ANN
+    index for every query vector in a single SQL statement, instead
+    of N round-trips through /search-by-image.
+    """
+    temp_paths = []
+    try:
+        # 1. บันทึกไฟล์ชั่วคราว
+        for file in files:
+            temp_path = os.path.join(UPLOAD_DIR, f"temp_{uuid.uuid4()}.jpg")
+            await save_upload(file, temp_path)
+            temp_paths.append(temp_path)
+
+        # 2. สร้าง embeddings ทั้ง batch ในครั้งเดียว
+        embeddings = await run_in_threadpool(
+            get_image_tagger().encode_images, temp_paths)
+
+        # 3. ค้นหาทุก query vector ใน statement เดียว
+        rows = await run_in_threadpool(
+            batch_image_similarity_search, embeddings, limit)
+
+        # 4. จัดกลุ่มผลลัพธ์ตามลำดับรูปที่อัพโหลด (idx เริ่มที่ 1)
+        grouped = [[] for _ in files]
+        for row in rows:
+            row = dict(row)
+            idx = row.pop('idx') - 1
+            grouped[idx].append(row)
+
+        return {
+            "results": grouped,
+            "total_queries": len(files)
+        }
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # ลบไฟล์ชั่วคราว
+        for temp_path in temp_paths:
+            with contextlib.suppress(FileNotFoundError):
+                await aiofiles.os.remove(temp_path)
 
 
 @router.get("/asset/{asset_id}")
@@ -195,84 +432,66 @@ async def get_asset_images(asset_id: int):
     ดูรูปภาพทั้งหมดของ asset
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("""
-            SELECT id, name, images, tags
-            FROM assets
-            WHERE id = %s
-        """, (asset_id,))
-        
-        asset = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
+        asset = await run_in_threadpool(
+            db_fetchone, "EXECUTE asset_detail (%s)", (asset_id,))
+
         if not asset:
             raise HTTPException(status_code=404, detail="Asset not found")
-        
+
+        rows = await run_in_threadpool(
+            db_fetchall, "EXECUTE list_images (%s)", (asset_id,))
+
+        images = [{"id": row['id'], **row['data']} for row in rows]
+
         return {
             "asset_id": asset['id'],
             "name": asset['name'],
-            "images": asset['images'] or [],
+            "images": images,
             "tags": asset['tags'] or [],
-            "total_images": len(asset['images']) if asset['images'] else 0
+            "total_images": len(images)
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.delete("/{asset_id}/image/{image_index}")
-async def delete_image(asset_id: int, image_index: int):
+@router.delete("/{asset_id}/image/{image_id}")
+async def delete_image(asset_id: int, image_id: int):
     """
     ลบรูปภาพ
-    
+
     Args:
         asset_id: ID ของ asset
-        image_index: ลำดับของรูปใน array (0-based)
+        image_id: ID ของรูปใน asset_images (stable - ไม่เลื่อนเหมือน
+            array index เดิมเมื่อมี upload พร้อมกัน)
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # 1. ดึงข้อมูล images ปัจจุบัน
-        cur.execute("SELECT images FROM assets WHERE id = %s", (asset_id,))
-        asset = cur.fetchone()
-        
-        if not asset:
-            raise HTTPException(status_code=404, detail="Asset not found")
-        
-        images = asset['images'] or []
-        
-        if image_index >= len(images):
+        # 1. ดึงข้อมูลรูปที่จะลบ
+        image = await run_in_threadpool(
+            db_fetchone, "EXECUTE get_image (%s, %s)", (image_id, asset_id))
+
+        if not image:
             raise HTTPException(status_code=404, detail="Image not found")
-        
-        # 2. ลบไฟล์จริง
-        image_to_delete = images[image_index]
-        file_path = image_to_delete['url'].replace('/uploads/', 'uploads/')
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
+
+        # 2. ลบไฟล์จริง - one unlink syscall instead of stat + unlink,
+        # which also closes the TOCTOU race between the two
+        file_path = image['data']['url'].replace('/uploads/', 'uploads/')
+
+        with contextlib.suppress(FileNotFoundError):
+            await aiofiles.os.remove(file_path)
+
         # 3. ลบจาก database
-        images.pop(image_index)
-        
-        cur.execute("""
-            UPDATE assets 
-            SET images = %s::jsonb
-            WHERE id = %s
-        """, (json.dumps(images), asset_id))
-        
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
+        await run_in_threadpool(
+            db_execute, "EXECUTE delete_image_row (%s)", (image_id,))
+
+        remaining = await run_in_threadpool(
+            db_fetchone, "EXECUTE count_images (%s)", (asset_id,))
+
+        stats_cache.pop('stats', None)
+
         return {
             "message": "Image deleted successfully",
-            "remaining_images": len(images)
+            "remaining_images": remaining['total']
         }
         
     except Exception as e:
@@ -283,10 +502,20 @@ async def delete_image(asset_id: int, image_index: int):
 async def serve_image(filename: str):
     """
     ให้บริการไฟล์รูปภาพ
+
+    Note: ใน production ควรให้ nginx serve uploads/ โดยตรง
     """
     file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    if not os.path.exists(file_path):
+
+    # One async stat for both the 404 check and the response headers,
+    # instead of os.path.exists + FileResponse stat-ing again
+    try:
+        stat_result = await aiofiles.os.stat(file_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Image not found")
-    
-    return FileResponse(file_path)
+
+    return FileResponse(
+        file_path,
+        stat_result=stat_result,
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
@@ -0,0 +1,62 @@
+"""
+Search API - semantic text search over assets
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import sys
+sys.path.append('..')
+
+from ai.models import get_text_encoder
+from api.images import db_cursor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+def semantic_search(query_embedding, limit: int):
+    """ANN search with per-transaction ef_search tuning"""
+    with db_cursor() as cur:
+        cur.execute("SET LOCAL hnsw.ef_search = 64")
+        cur.execute("""
+            SELECT
+                id,
+                name,
+                location_type,
+                district,
+                province,
+                tags,
+                ST_AsText(location) as coordinates,
+                1 - (embedding <=> %s::vector) as similarity
+            FROM assets
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+        """, (query_embedding, query_embedding, limit))
+        return cur.fetchall()
+
+
+@router.get("")
+async def search_assets(q: str, limit: int = 10):
+    """
+    ค้นหา assets ด้วยข้อความ (semantic search)
+
+    Args:
+        q: คำค้นหา (Thai/English)
+        limit: จำนวนผลลัพธ์สูงสุด
+    """
+    try:
+        query_embedding = await run_in_threadpool(
+            lambda: get_text_encoder().encode(q).tolist())
+
+        results = await run_in_threadpool(semantic_search, query_embedding, limit)
+
+        return {
+            "query": q,
+            "results": [dict(row) for row in results],
+            "total": len(results)
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
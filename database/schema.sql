@@ -19,9 +19,14 @@ CREATE TABLE IF NOT EXISTS assets (
     embedding vector(768),  -- Sentence transformer embeddings
     
     -- New fields
-    images JSONB DEFAULT '[]'::jsonb,  -- Array of image objects
+    -- (image metadata lives in the asset_images child table below;
+    --  appending to a jsonb array rewrote the whole blob per upload)
     tags TEXT[] DEFAULT ARRAY[]::text[],  -- Searchable tags
-    image_embeddings vector(768),  -- Image embeddings for similarity search
+    -- fp16 halves index memory and ANN scan bandwidth with negligible
+    -- recall loss; CLIP ViT-B/32 embeddings are 512-dim
+    -- (migration: ALTER TABLE assets ALTER COLUMN image_embeddings
+    --  TYPE halfvec(512) USING image_embeddings::halfvec(512);)
+    image_embeddings halfvec(512),  -- Image embeddings for similarity search (fp16)
     search_vector tsvector,  -- Full-text search vector
     
     -- Metadata
@@ -36,7 +41,7 @@ CREATE TABLE IF NOT EXISTS assets (
 
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_location ON assets USING GIST(location);
-CREATE INDEX IF NOT EXISTS idx_embedding ON assets USING ivfflat (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_embedding ON assets USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
 CREATE INDEX IF NOT EXISTS idx_location_type ON assets(location_type);
 CREATE INDEX IF NOT EXISTS idx_district ON assets(district);
 CREATE INDEX IF NOT EXISTS idx_province ON assets(province);
@@ -44,14 +49,29 @@ CREATE INDEX IF NOT EXISTS idx_status ON assets(status);
 
 -- New indexes
 CREATE INDEX IF NOT EXISTS idx_tags ON assets USING GIN(tags);
-CREATE INDEX IF NOT EXISTS idx_images ON assets USING GIN(images);
-CREATE INDEX IF NOT EXISTS idx_image_embeddings ON assets USING ivfflat (image_embeddings vector_cosine_ops);
+-- HNSW so image similarity search can use an index probe (halfvec requires pgvector >= 0.7.0)
+CREATE INDEX IF NOT EXISTS idx_image_embeddings ON assets USING hnsw (image_embeddings halfvec_cosine_ops) WITH (m = 16, ef_construction = 64);
 CREATE INDEX IF NOT EXISTS idx_search_vector ON assets USING GIN(search_vector);
 
 -- Composite indexes
 CREATE INDEX IF NOT EXISTS idx_location_district ON assets(location_type, district);
 CREATE INDEX IF NOT EXISTS idx_status_type ON assets(status, location_type);
 
+-- Image metadata as a child table: inserting a row is O(1) no matter
+-- how many images an asset has, unlike appending to a jsonb array
+-- which rewrote (and re-TOASTed) the whole blob on every upload.
+-- (migration: INSERT INTO asset_images (asset_id, data)
+--  SELECT id, jsonb_array_elements(images) FROM assets
+--  WHERE images IS NOT NULL; then drop the assets.images column)
+CREATE TABLE IF NOT EXISTS asset_images (
+    id BIGSERIAL PRIMARY KEY,
+    asset_id INT REFERENCES assets(id) ON DELETE CASCADE,
+    data JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_asset_images_asset_id ON asset_images (asset_id);
+
 -- Function to auto-update updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -90,7 +110,7 @@ CREATE TRIGGER assets_search_vector_trigger
 COMMENT ON TABLE assets IS 'Main table for disaster relief assets and locations';
 COMMENT ON COLUMN assets.location IS 'Geographic coordinates (PostGIS POINT)';
 COMMENT ON COLUMN assets.embedding IS 'Text embedding vector for semantic search (768 dimensions)';
-COMMENT ON COLUMN assets.images IS 'JSONB array of image metadata: [{"url": "", "caption": "", "uploaded_at": ""}]';
+COMMENT ON TABLE asset_images IS 'Per-image metadata: {"url": "", "caption": "", "uploaded_at": ""}';
 COMMENT ON COLUMN assets.tags IS 'Array of searchable tags in Thai/English';
 COMMENT ON COLUMN assets.image_embeddings IS 'Image embedding vector for visual similarity search';
 COMMENT ON COLUMN assets.search_vector IS 'Full-text search vector (auto-updated)';
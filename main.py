@@ -5,6 +5,7 @@ FastAPI server for AI-powered disaster relief search
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -12,17 +13,29 @@ from dotenv import load_dotenv
 # Import routers
 from api.search import router as search_router
 from api.images import router as images_router
+from ai.models import get_image_tagger, get_text_encoder
 
 # Load environment variables
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the model singletons at startup so the first request
+    # doesn't pay CLIP/MiniLM load time
+    get_image_tagger()
+    get_text_encoder()
+    yield
+
+
 # Initialize FastAPI
 app = FastAPI(
     title="Mercil Backend API",
     description="AI-powered search system for disaster relief locations",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -79,51 +92,41 @@ async def get_stats():
     """
     ดูสถิติของระบบ
     """
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-    
+    from fastapi.concurrency import run_in_threadpool
+    from api.images import db_fetchone, stats_cache
+
+    # Serve recent results from cache - these aggregates change on the
+    # order of minutes and writes invalidate the entry anyway
+    if (cached := stats_cache.get('stats')) is not None:
+        return cached
+
     try:
-        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Total assets
-        cur.execute("SELECT COUNT(*) as total FROM assets")
-        total_assets = cur.fetchone()['total']
-        
-        # Assets by type
-        cur.execute("""
-            SELECT location_type, COUNT(*) as count
-            FROM assets
-            GROUP BY location_type
-            ORDER BY count DESC
+        # All four aggregates in one CTE query - one round-trip and
+        # one row instead of four separate statements. Runs in the
+        # threadpool so the sync psycopg2 call cannot stall the loop.
+        stats = await run_in_threadpool(db_fetchone, """
+            WITH by_type AS (
+                SELECT location_type, COUNT(*) as count
+                FROM assets
+                GROUP BY location_type
+                ORDER BY count DESC
+            )
+            SELECT
+                (SELECT COUNT(*) FROM assets) as total_assets,
+                (SELECT jsonb_agg(row_to_json(by_type)) FROM by_type) as assets_by_type,
+                (SELECT COUNT(DISTINCT asset_id) FROM asset_images) as assets_with_images,
+                (SELECT COUNT(DISTINCT tag)
+                 FROM assets, unnest(tags) as tag) as total_unique_tags
         """)
-        by_type = cur.fetchall()
-        
-        # Assets with images
-        cur.execute("""
-            SELECT COUNT(*) as total
-            FROM assets
-            WHERE images IS NOT NULL AND jsonb_array_length(images) > 0
-        """)
-        with_images = cur.fetchone()['total']
-        
-        # Total tags
-        cur.execute("""
-            SELECT COUNT(DISTINCT unnest(tags)) as total
-            FROM assets
-            WHERE tags IS NOT NULL
-        """)
-        total_tags = cur.fetchone()['total']
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            "total_assets": total_assets,
-            "assets_by_type": [dict(row) for row in by_type],
-            "assets_with_images": with_images,
-            "total_unique_tags": total_tags
+
+        result = {
+            "total_assets": stats['total_assets'],
+            "assets_by_type": stats['assets_by_type'] or [],
+            "assets_with_images": stats['assets_with_images'],
+            "total_unique_tags": stats['total_unique_tags']
         }
+        stats_cache['stats'] = result
+        return result
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,38 @@
+"""
+Export all-MiniLM-L6-v2 to ONNX with int8 dynamic quantization.
+
+The exported model is picked up automatically by data_loader.py when
+the output directory exists (see ONNX_MODEL_PATH there).
+
+Usage:
+    pip install "optimum[onnxruntime]"
+    python scripts/export_minilm_onnx.py [output_dir]
+"""
+import sys
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def main():
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else 'models/minilm-onnx'
+
+    print(f"📦 Exporting {MODEL_NAME} to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    print("🔧 Applying int8 dynamic quantization...")
+    quantizer = ORTQuantizer.from_pretrained(output_dir)
+    qconfig = AutoQuantizationConfig.avx2(is_static=False)
+    quantizer.quantize(save_dir=output_dir, quantization_config=qconfig)
+
+    print(f"✅ Exported quantized MiniLM to {output_dir}")
+
+
+if __name__ == "__main__":
+    main()